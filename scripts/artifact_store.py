@@ -0,0 +1,164 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from cryptography.fernet import Fernet
+    CRYPTOGRAPHY_AVAILABLE = True
+except ImportError:
+    CRYPTOGRAPHY_AVAILABLE = False
+
+class ArtifactStore:
+    # Generated PDFs are stored once per distinct content (sha256 of the
+    # plaintext) under root/blobs, with a SQLite index shared by every worker
+    # on the node. Eviction runs on each put: expired entries first, then the
+    # least recently accessed until the store fits in max_bytes.
+    def __init__(self, root: str, ttl_seconds: int = 7 * 24 * 3600,
+                 max_bytes: int = 512 * 1024 * 1024, encryption_key: Optional[str] = None):
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.sqlite3"
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self.fernet = None
+        if encryption_key:
+            if not CRYPTOGRAPHY_AVAILABLE:
+                raise RuntimeError("ARTIFACT_STORE_KEY is set but the cryptography package is not installed")
+            self.fernet = Fernet(encryption_key.encode())
+
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " id TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " media_type TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.index_path), timeout=30, isolation_level=None)
+
+    def _blob_path(self, document_id: str) -> Path:
+        return self.blob_dir / document_id[:2] / document_id
+
+    def put(self, content: bytes, media_type: str = "application/pdf") -> str:
+        document_id = hashlib.sha256(content).hexdigest()
+        now = time.time()
+        blob_path = self._blob_path(document_id)
+
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT id FROM documents WHERE id = ?", (document_id,)).fetchone()
+            if row and blob_path.exists():
+                # Generating the same document again restarts its TTL, so the
+                # ID handed back to the caller is not already expired.
+                conn.execute(
+                    "UPDATE documents SET created_at = ?, accessed_at = ? WHERE id = ?",
+                    (now, now, document_id),
+                )
+                return document_id
+
+            payload = self.fernet.encrypt(content) if self.fernet else content
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=str(blob_path.parent), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as tmp_file:
+                    tmp_file.write(payload)
+                os.replace(tmp_path, blob_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (id, size, media_type, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (document_id, len(payload), media_type, now, now),
+            )
+            self._evict(conn, now, keep=document_id)
+
+        return document_id
+
+    def get(self, document_id: str) -> Optional[bytes]:
+        if len(document_id) != 64 or not all(ch in "0123456789abcdef" for ch in document_id):
+            return None
+
+        now = time.time()
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT created_at FROM documents WHERE id = ?", (document_id,)).fetchone()
+            if not row:
+                return None
+            if self.ttl_seconds and row[0] + self.ttl_seconds < now:
+                self._delete(conn, document_id)
+                return None
+            conn.execute("UPDATE documents SET accessed_at = ? WHERE id = ?", (now, document_id))
+
+        try:
+            payload = self._blob_path(document_id).read_bytes()
+        except FileNotFoundError:
+            return None
+        return self.fernet.decrypt(payload) if self.fernet else payload
+
+    def _delete(self, conn: sqlite3.Connection, document_id: str) -> None:
+        conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+        try:
+            self._blob_path(document_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, conn: sqlite3.Connection, now: float, keep: str) -> None:
+        if self.ttl_seconds:
+            expired = conn.execute(
+                "SELECT id FROM documents WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).fetchall()
+            for (document_id,) in expired:
+                self._delete(conn, document_id)
+
+        if not self.max_bytes:
+            return
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for document_id, size in conn.execute(
+            "SELECT id, size FROM documents WHERE id != ? ORDER BY accessed_at ASC", (keep,)
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._delete(conn, document_id)
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} documents from artifact store")
+
+def create_artifact_store_from_env() -> Optional[ArtifactStore]:
+    # Stored PDFs contain full SSNs, so the store is opt-in: it is only
+    # enabled when ARTIFACT_STORE_DIR is set.
+    root = os.environ.get("ARTIFACT_STORE_DIR")
+    if not root or os.environ.get("ARTIFACT_STORE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+
+    try:
+        store = ArtifactStore(
+            root,
+            ttl_seconds=int(os.environ.get("ARTIFACT_STORE_TTL_SECONDS", 7 * 24 * 3600)),
+            max_bytes=int(os.environ.get("ARTIFACT_STORE_MAX_BYTES", 512 * 1024 * 1024)),
+            encryption_key=os.environ.get("ARTIFACT_STORE_KEY") or None,
+        )
+    except Exception as e:
+        logger.error(f"Artifact store disabled: {e}")
+        return None
+
+    logger.info(f"Artifact store enabled at {root} (encrypted: {store.fernet is not None})")
+    return store
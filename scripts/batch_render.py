@@ -0,0 +1,272 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+# The offline renderer never serves documents, so keep the HTTP artifact store off.
+os.environ.setdefault("ARTIFACT_STORE_DISABLED", "1")
+
+import main
+from main import FormType, ScheduleCData, ScheduleEData
+
+logger = logging.getLogger("batch_render")
+
+TEMPLATE_FILES = {
+    FormType.SCHEDULE_C: "f1040sc.pdf",
+    FormType.SCHEDULE_E: "schedule-e.pdf",
+}
+
+_worker_templates: Dict[FormType, object] = {}
+_worker_output_path: Optional[str] = None
+_worker_error: Optional[str] = None
+
+def parse_payload(text: str) -> Dict:
+    payload = json.loads(text)
+    if not isinstance(payload, dict):
+        raise ValueError("payload is not a JSON object")
+    return payload
+
+def iter_payloads(input_path: Path) -> Iterator[Tuple[str, Optional[Dict], Optional[str]]]:
+    # Unparseable entries are yielded with an error instead of aborting the run.
+    if input_path.is_dir():
+        for path in sorted(input_path.glob("*.json")):
+            try:
+                yield path.stem, parse_payload(path.read_text()), None
+            except (ValueError, UnicodeDecodeError) as e:
+                yield path.stem, None, str(e)
+        return
+
+    with open(input_path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                payload = parse_payload(line)
+            except ValueError as e:
+                yield f"line {line_number}", None, str(e)
+                continue
+            yield str(payload.pop("id", line_number)), payload, None
+
+def resolve_form_type(payload: Dict, default: Optional[FormType]) -> FormType:
+    form_type = payload.pop("formType", None)
+    if form_type:
+        return FormType(form_type)
+    if default is None:
+        raise ValueError("payload has no formType and --form-type was not given")
+    return default
+
+def template_path_for(form_type: FormType) -> Path:
+    return Path(main.__file__).parent / TEMPLATE_FILES[form_type]
+
+def load_templates() -> Dict[FormType, object]:
+    if not main.PDF_LIBRARY_AVAILABLE:
+        return {}
+    return {form_type: main.PdfReader(str(template_path_for(form_type))) for form_type in TEMPLATE_FILES}
+
+def init_worker(log_level: int, scratch_dir: str) -> None:
+    # An exception escaping a Pool initializer makes the pool respawn the
+    # worker forever, so failures are reported per job instead.
+    global _worker_output_path, _worker_error
+    logging.getLogger("main").setLevel(log_level)
+
+    try:
+        _worker_templates.update(load_templates())
+        fd, _worker_output_path = tempfile.mkstemp(suffix=".pdf", dir=scratch_dir)
+        os.close(fd)
+    except Exception as e:
+        _worker_error = f"worker initialization failed: {e}"
+
+def render_payload(job: Tuple[str, FormType, Dict]) -> Tuple[str, Optional[bytes], Optional[str]]:
+    document_id, form_type, payload = job
+    if _worker_error is not None:
+        return document_id, None, _worker_error
+    template_path = str(template_path_for(form_type))
+    template = _worker_templates.get(form_type)
+
+    try:
+        if form_type == FormType.SCHEDULE_C:
+            success = main.fill_schedule_c_pdf_template(
+                template_path, _worker_output_path, ScheduleCData(**payload), template=template
+            )
+        else:
+            success = main.fill_schedule_e_pdf_template(
+                template_path, _worker_output_path, ScheduleEData(**payload), template=template
+            )
+        if not success:
+            return document_id, None, "render failed"
+
+        with open(_worker_output_path, "rb") as f:
+            return document_id, f.read(), None
+    except Exception as e:
+        return document_id, None, str(e)
+
+def load_checkpoint(checkpoint_path: Path) -> Set[str]:
+    if not checkpoint_path.exists():
+        return set()
+    with open(checkpoint_path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+def check_document_id(document_id: str) -> Optional[str]:
+    # IDs become output filenames, so they must stay inside the output directory.
+    if not document_id or document_id.startswith("."):
+        return "id must not be empty or start with '.'"
+    if any(ch in document_id for ch in ("/", "\\", "\0")):
+        return "id must not contain path separators"
+    return None
+
+def write_output(directory: Path, filename: str, content: bytes) -> None:
+    # Written under a temporary name first so a killed run never leaves a
+    # truncated PDF behind that the checkpoint claims is finished.
+    tmp_path = directory / f".{filename}.tmp"
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, directory / filename)
+
+def read_archive_names(archive_path: Path) -> Set[str]:
+    if not archive_path.exists():
+        return set()
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            return set(archive.namelist())
+    except zipfile.BadZipFile:
+        logger.warning(f"Ignoring unreadable archive {archive_path}")
+        return set()
+
+def rendered_ids(names) -> Set[str]:
+    return {name[:-4] for name in names if name.endswith(".pdf")}
+
+def finalize_archive(output_path: Path, staging_dir: Path) -> None:
+    # ZIP output is staged as plain files and only packed once the run ends,
+    # so an interrupted run keeps every PDF it checkpointed.
+    staged = sorted(staging_dir.glob("*.pdf"))
+    if not staged:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return
+
+    staged_names = {path.name for path in staged}
+    tmp_path = output_path.with_name(f"{output_path.name}.tmp")
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        if read_archive_names(output_path):
+            with zipfile.ZipFile(output_path) as previous:
+                for info in previous.infolist():
+                    if info.filename not in staged_names:
+                        archive.writestr(info, previous.read(info))
+        for path in staged:
+            archive.write(path, arcname=path.name)
+    os.replace(tmp_path, output_path)
+    shutil.rmtree(staging_dir)
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Render Schedule C/E payloads to PDF without the HTTP server")
+    parser.add_argument("input", help="directory of *.json payloads or a JSONL file")
+    parser.add_argument("output", help="output directory, or a path ending in .zip")
+    parser.add_argument("--form-type", choices=[t.value for t in FormType],
+                        help="form type for payloads without a formType key")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--checkpoint", help="progress file used to resume (default: <output>.checkpoint)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    log_level = logging.INFO if args.verbose else logging.WARNING
+
+    try:
+        load_templates()
+    except Exception as e:
+        logger.error(f"Cannot load PDF templates: {e}")
+        return 2
+
+    input_path = Path(args.input)
+    output_path = Path(args.output)
+    checkpoint_path = Path(args.checkpoint or f"{output_path}.checkpoint")
+    default_form_type = FormType(args.form_type) if args.form_type else None
+
+    to_zip = output_path.suffix.lower() == ".zip"
+    if to_zip:
+        staging_dir = output_path.with_name(f"{output_path.name}.staging")
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        present = rendered_ids(read_archive_names(output_path)) | rendered_ids(p.name for p in staging_dir.glob("*.pdf"))
+    else:
+        staging_dir = output_path
+        output_path.mkdir(parents=True, exist_ok=True)
+        present = rendered_ids(p.name for p in output_path.glob("*.pdf"))
+
+    checkpointed = load_checkpoint(checkpoint_path)
+    completed = checkpointed & present
+    if len(completed) < len(checkpointed):
+        logger.warning(
+            f"{len(checkpointed) - len(completed)} checkpointed payloads are missing from the output "
+            f"and will be rendered again"
+        )
+    if completed:
+        logger.info(f"Resuming: {len(completed)} payloads already rendered")
+
+    jobs = []
+    failures = 0
+    seen_ids: Set[str] = set()
+    for document_id, payload, error in iter_payloads(input_path):
+        if error is not None:
+            logger.error(f"Skipping {document_id}: {error}")
+            failures += 1
+            continue
+        error = check_document_id(document_id)
+        if error is None and document_id in seen_ids:
+            error = "duplicate id"
+        if error is not None:
+            logger.error(f"Skipping {document_id!r}: {error}")
+            failures += 1
+            continue
+        seen_ids.add(document_id)
+
+        if document_id in completed:
+            continue
+        try:
+            jobs.append((document_id, resolve_form_type(payload, default_form_type), payload))
+        except ValueError as e:
+            logger.error(f"Skipping {document_id}: {e}")
+            failures += 1
+
+    rendered = 0
+    total_bytes = 0
+    start = time.perf_counter()
+    with open(checkpoint_path, "a") as checkpoint, tempfile.TemporaryDirectory() as scratch_dir, \
+            multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(log_level, scratch_dir)) as pool:
+        for document_id, content, error in pool.imap_unordered(render_payload, jobs, chunksize=4):
+            if error is not None:
+                logger.error(f"Failed to render {document_id}: {error}")
+                failures += 1
+                continue
+
+            try:
+                write_output(staging_dir, f"{document_id}.pdf", content)
+            except OSError as e:
+                logger.error(f"Failed to write {document_id}: {e}")
+                failures += 1
+                continue
+            checkpoint.write(f"{document_id}\n")
+            checkpoint.flush()
+            rendered += 1
+            total_bytes += len(content)
+
+    if to_zip:
+        finalize_archive(output_path, staging_dir)
+
+    elapsed = time.perf_counter() - start
+    rate = rendered / elapsed if elapsed > 0 else 0.0
+    print(
+        f"Rendered {rendered} PDFs ({total_bytes / 1024 / 1024:.1f} MiB) in {elapsed:.2f}s "
+        f"with {args.workers} workers: {rate:.1f} PDFs/s; "
+        f"{len(completed)} skipped from checkpoint, {failures} failed"
+    )
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,14 +1,23 @@
+import asyncio
+import hashlib
+import io
 import logging
 import os
 import tempfile
+import time
+import zipfile
 from pathlib import Path
-from typing import Dict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from enum import Enum
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
+
+from artifact_store import create_artifact_store_from_env
+from profiling import call_profiled, create_profiler_from_env, current_profile
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,10 +30,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Document-Id"],
 )
 
 try:
-    from pdfrw import PdfReader, PdfWriter, PdfDict
+    from pdfrw import PdfReader, PdfWriter, PdfDict, PageMerge
     PDF_LIBRARY_AVAILABLE = True
     logger.info("pdfrw library loaded successfully")
 except ImportError:
@@ -39,6 +49,45 @@ try:
 except ImportError:
     REPORTLAB_AVAILABLE = False
 
+artifact_store = create_artifact_store_from_env()
+profiler = create_profiler_from_env()
+
+async def profile_render_requests(request: Request, call_next):
+    if request.method != "POST" or not request.url.path.startswith("/generate"):
+        return await call_next(request)
+
+    requested = request.headers.get("x-profile") == "1" or request.query_params.get("profile") == "1"
+    if requested and not profiler.authorized(request.headers.get("x-profile-token")):
+        return JSONResponse({"detail": "Profiling not authorized"}, status_code=403)
+    if not requested and not profiler.should_sample():
+        return await call_next(request)
+
+    profile = profiler.start()
+    if profile is None:
+        if requested:
+            return JSONResponse({"detail": "Another profile is in progress"}, status_code=409)
+        return await call_next(request)
+
+    start = time.perf_counter()
+    token = current_profile.set(profile)
+    try:
+        response = await call_next(request)
+    finally:
+        current_profile.reset(token)
+        result = profiler.stop(profile, request.url.path, time.perf_counter() - start)
+
+    if not requested:
+        profiler.record(result)
+        return response
+
+    result["status_code"] = response.status_code
+    return JSONResponse(result)
+
+# BaseHTTPMiddleware adds noticeable per-request overhead, so it is only
+# installed when profiling is enabled.
+if profiler.enabled:
+    app.middleware("http")(profile_render_requests)
+
 class FormType(str, Enum):
     SCHEDULE_C = "schedule_c"
     SCHEDULE_E = "schedule_e"
@@ -210,6 +259,22 @@ class ScheduleEData(BaseModel):
     property3Utilities: str = ""
     property3Depreciation: str = ""
 
+class OutputVariant(BaseModel):
+    name: str = Field(pattern=r"^[A-Za-z0-9_-]+$")
+    # Input field names, e.g. "ssn"; masked values are fully redacted except
+    # for the last 4 characters of an SSN
+    mask: List[str] = []
+    omit: List[str] = []
+    watermark: str = ""
+
+class ScheduleCVariantsRequest(BaseModel):
+    data: ScheduleCData
+    variants: List[OutputVariant]
+
+class ScheduleEVariantsRequest(BaseModel):
+    data: ScheduleEData
+    variants: List[OutputVariant]
+
 def safe_float(value: str) -> float:
     try:
         return float(value) if value else 0.0
@@ -402,7 +467,7 @@ def create_schedule_c_fallback_pdf(data: ScheduleCData, output_path: str) -> boo
                 c.drawString(50, y_position, f"Other: {desc} - ${safe_float(amount):,.2f}")
                 y_position -= 15
         
-        totals = calculate_totals(data)
+        totals = calculate_schedule_c_totals(data)
         y_position -= 20
         c.setFont("Helvetica-Bold", 14)
         c.drawString(50, y_position, f"Gross Income: ${totals['gross_income']:,.2f}")
@@ -511,101 +576,108 @@ def create_schedule_e_fallback_pdf(data: ScheduleEData, output_path: str) -> boo
         logger.error(f"Error creating Schedule E fallback PDF: {e}")
         return False
 
-def fill_schedule_c_pdf_template(template_path: str, output_path: str, data: ScheduleCData) -> bool:
+def schedule_c_field_mappings(data: ScheduleCData) -> Dict[str, str]:
+    return {
+        '<FEFF00660031005F0031005B0030005D>': data.name,
+        '<FEFF00660031005F0032005B0030005D>': data.ssn,
+        '<FEFF00660031005F0033005B0030005D>': data.principalBusinessActivity,
+        '<FEFF00660031005F0034005B0030005D>': data.businessCode,
+        '<FEFF00660031005F0035005B0030005D>': data.businessName,
+        '<FEFF00660031005F0036005B0030005D>': data.businessAddress,
+        '<FEFF00660031005F0037005B0030005D>': f"{data.city}, {data.state} {data.zipCode}",
+        '<FEFF00660031005F0038005B0030005D>': data.businessStartDate,
+        '<FEFF00660031005F0039005B0030005D>': data.additionalBusinessInfo,
+        '<FEFF00660031005F00310030005B0030005D>': data.grossReceipts,
+        '<FEFF00660031005F00310031005B0030005D>': data.returnsAllowances,
+        '<FEFF00660031005F00310032005B0030005D>': data.otherIncome,
+        '<FEFF00660031005F00310034005B0030005D>': data.advertising,
+        '<FEFF00660031005F00310035005B0030005D>': data.carTruckExpenses,
+        '<FEFF00660031005F00310036005B0030005D>': data.commissionsAndFees,
+        '<FEFF00660031005F00310037005B0030005D>': data.contractLabor,
+        '<FEFF00660031005F00310038005B0030005D>': data.depletion,
+        '<FEFF00660031005F00310039005B0030005D>': data.depreciation,
+        '<FEFF00660031005F00320030005B0030005D>': data.employeeBenefitPrograms,
+        '<FEFF00660031005F00320031005B0030005D>': data.insurance,
+        '<FEFF00660031005F00320032005B0030005D>': data.interestMortgage,
+        '<FEFF00660031005F00320033005B0030005D>': data.interestOther,
+        '<FEFF00660031005F00320034005B0030005D>': data.legalProfessionalServices,
+        '<FEFF00660031005F00320035005B0030005D>': data.officeExpense,
+        '<FEFF00660031005F00320036005B0030005D>': data.pensionProfitSharing,
+        '<FEFF00660031005F00320037005B0030005D>': data.rentLeaseVehicles,
+        '<FEFF00660031005F00320038005B0030005D>': data.rentLeaseMachinery,
+        '<FEFF00660031005F00320039005B0030005D>': data.rentLeaseOther,
+        '<FEFF00660031005F00330030005B0030005D>': data.repairsMaintenance,
+        '<FEFF00660031005F00330031005B0030005D>': data.supplies,
+        '<FEFF00660031005F00330032005B0030005D>': data.taxesLicenses,
+        '<FEFF00660031005F00330033005B0030005D>': data.travel,
+        '<FEFF00660031005F00330034005B0030005D>': data.deductibleMeals,
+        '<FEFF00660031005F00330035005B0030005D>': data.utilities,
+        '<FEFF00660031005F00330036005B0030005D>': data.wages,
+        '<FEFF00660032005F0031005B0030005D>': data.vehicleMakeModel,
+        '<FEFF00660032005F0032005B0030005D>': data.vehicleYear,
+        '<FEFF00660032005F0033005B0030005D>': data.totalMiles,
+        '<FEFF00660032005F0034005B0030005D>': data.businessMiles,
+        '<FEFF00660032005F0035005B0030005D>': data.commutingMiles,
+        '<FEFF00660032005F0036005B0030005D>': data.otherPersonalMiles,
+        '<FEFF00660032005F0037005B0030005D>': data.availableForPersonalUse,
+        '<FEFF00660032005F0038005B0030005D>': data.evidenceToSupportDeduction,
+        '<FEFF00660032005F0039005B0030005D>': data.evidenceWritten,
+        '<FEFF00660032005F00310035005B0030005D>': data.otherExpense1Desc,
+        '<FEFF00660032005F00310036005B0030005D>': data.otherExpense1Amount,
+        '<FEFF00660032005F00310037005B0030005D>': data.otherExpense2Desc,
+        '<FEFF00660032005F00310038005B0030005D>': data.otherExpense2Amount,
+        '<FEFF00660032005F00310039005B0030005D>': data.otherExpense3Desc,
+        '<FEFF00660032005F00320030005B0030005D>': data.otherExpense3Amount,
+        '<FEFF00660032005F00320031005B0030005D>': data.otherExpense4Desc,
+        '<FEFF00660032005F00320032005B0030005D>': data.otherExpense4Amount,
+        '<FEFF00660032005F00320033005B0030005D>': data.otherExpense5Desc,
+        '<FEFF00660032005F00320034005B0030005D>': data.otherExpense5Amount,
+        '<FEFF00660032005F00320035005B0030005D>': data.otherExpense6Desc,
+        '<FEFF00660032005F00320036005B0030005D>': data.otherExpense6Amount,
+        '<FEFF00660032005F00320037005B0030005D>': data.otherExpense7Desc,
+        '<FEFF00660032005F00320038005B0030005D>': data.otherExpense7Amount,
+        '<FEFF00660032005F00320039005B0030005D>': data.otherExpense8Desc,
+        '<FEFF00660032005F00330030005B0030005D>': data.otherExpense8Amount,
+        '<FEFF00660032005F00330031005B0030005D>': data.otherExpense9Desc,
+        '<FEFF00660032005F00330032005B0030005D>': data.otherExpense9Amount,
+        '<FEFF00660032005F00330033005B0030005D>': data.otherExpense10Desc,
+    }
+
+def fill_template_fields(template, field_mappings: Dict[str, str]) -> int:
+    # Mapped fields without a value are cleared so that a template parsed once
+    # can be filled again for the next payload.
+    filled_fields = 0
+    for page in template.pages:
+        if '/Annots' in page:
+            for annot in page['/Annots']:
+                if annot['/Subtype'] == '/Widget':
+                    field_name = annot['/T']
+                    if field_name in field_mappings:
+                        value = field_mappings[field_name]
+                        if value:
+                            annot.update(PdfDict(V=str(value)))
+                            filled_fields += 1
+                        elif annot['/V'] is not None:
+                            annot.V = None
+    return filled_fields
+
+def write_filled_template(template, output_path: str) -> None:
+    output = PdfWriter()
+    output.addpage(template.pages[0])
+    if len(template.pages) > 1:
+        output.addpage(template.pages[1])
+    output.write(output_path)
+
+def fill_schedule_c_pdf_template(template_path: str, output_path: str, data: ScheduleCData, template=None) -> bool:
     if not PDF_LIBRARY_AVAILABLE:
         return create_schedule_c_fallback_pdf(data, output_path)
     
     try:
-        template = PdfReader(template_path)
-        print("template",template)
-       
-        output = PdfWriter()
-
-        print("output",output)
-        
-        field_mappings = {
-            '<FEFF00660031005F0031005B0030005D>': data.name,
-            '<FEFF00660031005F0032005B0030005D>': data.ssn,
-            '<FEFF00660031005F0033005B0030005D>': data.principalBusinessActivity,
-            '<FEFF00660031005F0034005B0030005D>': data.businessCode,
-            '<FEFF00660031005F0035005B0030005D>': data.businessName,
-            '<FEFF00660031005F0036005B0030005D>': data.businessAddress,
-            '<FEFF00660031005F0037005B0030005D>': f"{data.city}, {data.state} {data.zipCode}",
-            '<FEFF00660031005F0038005B0030005D>': data.businessStartDate,
-            '<FEFF00660031005F0039005B0030005D>': data.additionalBusinessInfo,
-            '<FEFF00660031005F00310030005B0030005D>': data.grossReceipts,
-            '<FEFF00660031005F00310031005B0030005D>': data.returnsAllowances,
-            '<FEFF00660031005F00310032005B0030005D>': data.otherIncome,
-            '<FEFF00660031005F00310034005B0030005D>': data.advertising,
-            '<FEFF00660031005F00310035005B0030005D>': data.carTruckExpenses,
-            '<FEFF00660031005F00310036005B0030005D>': data.commissionsAndFees,
-            '<FEFF00660031005F00310037005B0030005D>': data.contractLabor,
-            '<FEFF00660031005F00310038005B0030005D>': data.depletion,
-            '<FEFF00660031005F00310039005B0030005D>': data.depreciation,
-            '<FEFF00660031005F00320030005B0030005D>': data.employeeBenefitPrograms,
-            '<FEFF00660031005F00320031005B0030005D>': data.insurance,
-            '<FEFF00660031005F00320032005B0030005D>': data.interestMortgage,
-            '<FEFF00660031005F00320033005B0030005D>': data.interestOther,
-            '<FEFF00660031005F00320034005B0030005D>': data.legalProfessionalServices,
-            '<FEFF00660031005F00320035005B0030005D>': data.officeExpense,
-            '<FEFF00660031005F00320036005B0030005D>': data.pensionProfitSharing,
-            '<FEFF00660031005F00320037005B0030005D>': data.rentLeaseVehicles,
-            '<FEFF00660031005F00320038005B0030005D>': data.rentLeaseMachinery,
-            '<FEFF00660031005F00320039005B0030005D>': data.rentLeaseOther,
-            '<FEFF00660031005F00330030005B0030005D>': data.repairsMaintenance,
-            '<FEFF00660031005F00330031005B0030005D>': data.supplies,
-            '<FEFF00660031005F00330032005B0030005D>': data.taxesLicenses,
-            '<FEFF00660031005F00330033005B0030005D>': data.travel,
-            '<FEFF00660031005F00330034005B0030005D>': data.deductibleMeals,
-            '<FEFF00660031005F00330035005B0030005D>': data.utilities,
-            '<FEFF00660031005F00330036005B0030005D>': data.wages,
-            '<FEFF00660032005F0031005B0030005D>': data.vehicleMakeModel,
-            '<FEFF00660032005F0032005B0030005D>': data.vehicleYear,
-            '<FEFF00660032005F0033005B0030005D>': data.totalMiles,
-            '<FEFF00660032005F0034005B0030005D>': data.businessMiles,
-            '<FEFF00660032005F0035005B0030005D>': data.commutingMiles,
-            '<FEFF00660032005F0036005B0030005D>': data.otherPersonalMiles,
-            '<FEFF00660032005F0037005B0030005D>': data.availableForPersonalUse,
-            '<FEFF00660032005F0038005B0030005D>': data.evidenceToSupportDeduction,
-            '<FEFF00660032005F0039005B0030005D>': data.evidenceWritten,
-            '<FEFF00660032005F00310035005B0030005D>': data.otherExpense1Desc,
-            '<FEFF00660032005F00310036005B0030005D>': data.otherExpense1Amount,
-            '<FEFF00660032005F00310037005B0030005D>': data.otherExpense2Desc,
-            '<FEFF00660032005F00310038005B0030005D>': data.otherExpense2Amount,
-            '<FEFF00660032005F00310039005B0030005D>': data.otherExpense3Desc,
-            '<FEFF00660032005F00320030005B0030005D>': data.otherExpense3Amount,
-            '<FEFF00660032005F00320031005B0030005D>': data.otherExpense4Desc,
-            '<FEFF00660032005F00320032005B0030005D>': data.otherExpense4Amount,
-            '<FEFF00660032005F00320033005B0030005D>': data.otherExpense5Desc,
-            '<FEFF00660032005F00320034005B0030005D>': data.otherExpense5Amount,
-            '<FEFF00660032005F00320035005B0030005D>': data.otherExpense6Desc,
-            '<FEFF00660032005F00320036005B0030005D>': data.otherExpense6Amount,
-            '<FEFF00660032005F00320037005B0030005D>': data.otherExpense7Desc,
-            '<FEFF00660032005F00320038005B0030005D>': data.otherExpense7Amount,
-            '<FEFF00660032005F00320039005B0030005D>': data.otherExpense8Desc,
-            '<FEFF00660032005F00330030005B0030005D>': data.otherExpense8Amount,
-            '<FEFF00660032005F00330031005B0030005D>': data.otherExpense9Desc,
-            '<FEFF00660032005F00330032005B0030005D>': data.otherExpense9Amount,
-            '<FEFF00660032005F00330033005B0030005D>': data.otherExpense10Desc,
-        }
-        
-        filled_fields = 0
-        for page in template.pages:
-            if '/Annots' in page:
-                for annot in page['/Annots']:
-                    if annot['/Subtype'] == '/Widget':
-                        field_name = annot['/T']
-                        if field_name in field_mappings:
-                            value = field_mappings[field_name]
-                            if value:
-                                annot.update(PdfDict(V=str(value)))
-                                filled_fields += 1
-        
-        output.addpage(template.pages[0])
-        if len(template.pages) > 1:
-            output.addpage(template.pages[1])
-        
-        output.write(output_path)
+        if template is None:
+            template = PdfReader(template_path)
+        
+        filled_fields = fill_template_fields(template, schedule_c_field_mappings(data))
+        write_filled_template(template, output_path)
         logger.info(f"Filled {filled_fields} fields in PDF")
         return True
         
@@ -613,90 +685,76 @@ def fill_schedule_c_pdf_template(template_path: str, output_path: str, data: Sch
         logger.error(f"Error filling PDF template: {e}")
         return create_schedule_c_fallback_pdf(data, output_path)
 
-def fill_schedule_e_pdf_template(template_path: str, output_path: str, data: ScheduleEData) -> bool:
+def schedule_e_field_mappings(data: ScheduleEData) -> Dict[str, str]:
+    # Field mappings for Schedule E based on actual PDF field names
+    return {
+        # Personal Information (same as Schedule C)
+        '<FEFF00660031005F0031005B0030005D>': data.name,
+        '<FEFF00660031005F0032005B0030005D>': data.ssn,
+        
+        # Property 1 fields (f1_ prefix)
+        '<FEFF00660031005F0033005B0030005D>': data.property1Type,
+        '<FEFF00660031005F0034005B0030005D>': data.property1Address,
+        '<FEFF00660031005F0035005B0030005D>': data.property1City,
+        '<FEFF00660031005F0036005B0030005D>': data.property1State,
+        '<FEFF00660031005F0037005B0030005D>': data.property1ZipCode,
+        '<FEFF00660031005F0038005B0030005D>': data.property1RentalDays,
+        '<FEFF00660031005F0039005B0030005D>': data.property1PersonalDays,
+        '<FEFF00660031005F00310030005B0030005D>': data.property1RentalIncome,
+        '<FEFF00660031005F00310031005B0030005D>': data.property1Royalties,
+        '<FEFF00660031005F00310032005B0030005D>': data.property1OtherIncome,
+        '<FEFF00660031005F00310033005B0030005D>': data.property1Advertising,
+        '<FEFF00660031005F00310034005B0030005D>': data.property1AutoTravel,
+        '<FEFF00660031005F00310035005B0030005D>': data.property1Cleaning,
+        '<FEFF00660031005F00310036005B0030005D>': data.property1Commissions,
+        '<FEFF00660031005F00310037005B0030005D>': data.property1Insurance,
+        '<FEFF00660031005F00310038005B0030005D>': data.property1Legal,
+        '<FEFF00660031005F00310039005B0030005D>': data.property1Management,
+        '<FEFF00660031005F00320030005B0030005D>': data.property1MortgageInterest,
+        '<FEFF00660031005F00320031005B0030005D>': data.property1OtherInterest,
+        '<FEFF00660031005F00320032005B0030005D>': data.property1Repairs,
+        '<FEFF00660031005F00320033005B0030005D>': data.property1Supplies,
+        '<FEFF00660031005F00320034005B0030005D>': data.property1Taxes,
+        '<FEFF00660031005F00320035005B0030005D>': data.property1Utilities,
+        '<FEFF00660031005F00320036005B0030005D>': data.property1Depreciation,
+        
+        # Property 2 fields (f2_ prefix)
+        '<FEFF00660032005F0031005B0030005D>': data.property2Type,
+        '<FEFF00660032005F0032005B0030005D>': data.property2Address,
+        '<FEFF00660032005F0033005B0030005D>': data.property2City,
+        '<FEFF00660032005F0034005B0030005D>': data.property2State,
+        '<FEFF00660032005F0035005B0030005D>': data.property2ZipCode,
+        '<FEFF00660032005F0036005B0030005D>': data.property2RentalDays,
+        '<FEFF00660032005F0037005B0030005D>': data.property2PersonalDays,
+        '<FEFF00660032005F0038005B0030005D>': data.property2RentalIncome,
+        '<FEFF00660032005F0039005B0030005D>': data.property2Royalties,
+        '<FEFF00660032005F00310030005B0030005D>': data.property2OtherIncome,
+        '<FEFF00660032005F00310031005B0030005D>': data.property2Advertising,
+        '<FEFF00660032005F00310032005B0030005D>': data.property2AutoTravel,
+        '<FEFF00660032005F00310033005B0030005D>': data.property2Cleaning,
+        '<FEFF00660032005F00310034005B0030005D>': data.property2Commissions,
+        '<FEFF00660032005F00310035005B0030005D>': data.property2Insurance,
+        '<FEFF00660032005F00310036005B0030005D>': data.property2Legal,
+        '<FEFF00660032005F00310037005B0030005D>': data.property2Management,
+        '<FEFF00660032005F00310038005B0030005D>': data.property2MortgageInterest,
+        '<FEFF00660032005F00310039005B0030005D>': data.property2OtherInterest,
+        '<FEFF00660032005F00320030005B0030005D>': data.property2Repairs,
+        '<FEFF00660032005F00320031005B0030005D>': data.property2Supplies,
+        '<FEFF00660032005F00320032005B0030005D>': data.property2Taxes,
+        '<FEFF00660032005F00320033005B0030005D>': data.property2Utilities,
+        '<FEFF00660032005F00320034005B0030005D>': data.property2Depreciation,
+    }
+
+def fill_schedule_e_pdf_template(template_path: str, output_path: str, data: ScheduleEData, template=None) -> bool:
     if not PDF_LIBRARY_AVAILABLE:
         return create_schedule_e_fallback_pdf(data, output_path)
     
     try:
-        template = PdfReader(template_path)
-        output = PdfWriter()
-        
-        # Field mappings for Schedule E based on actual PDF field names
-        field_mappings = {
-            # Personal Information (same as Schedule C)
-            '<FEFF00660031005F0031005B0030005D>': data.name,
-            '<FEFF00660031005F0032005B0030005D>': data.ssn,
-            
-            # Property 1 fields (f1_ prefix)
-            '<FEFF00660031005F0033005B0030005D>': data.property1Type,
-            '<FEFF00660031005F0034005B0030005D>': data.property1Address,
-            '<FEFF00660031005F0035005B0030005D>': data.property1City,
-            '<FEFF00660031005F0036005B0030005D>': data.property1State,
-            '<FEFF00660031005F0037005B0030005D>': data.property1ZipCode,
-            '<FEFF00660031005F0038005B0030005D>': data.property1RentalDays,
-            '<FEFF00660031005F0039005B0030005D>': data.property1PersonalDays,
-            '<FEFF00660031005F00310030005B0030005D>': data.property1RentalIncome,
-            '<FEFF00660031005F00310031005B0030005D>': data.property1Royalties,
-            '<FEFF00660031005F00310032005B0030005D>': data.property1OtherIncome,
-            '<FEFF00660031005F00310033005B0030005D>': data.property1Advertising,
-            '<FEFF00660031005F00310034005B0030005D>': data.property1AutoTravel,
-            '<FEFF00660031005F00310035005B0030005D>': data.property1Cleaning,
-            '<FEFF00660031005F00310036005B0030005D>': data.property1Commissions,
-            '<FEFF00660031005F00310037005B0030005D>': data.property1Insurance,
-            '<FEFF00660031005F00310038005B0030005D>': data.property1Legal,
-            '<FEFF00660031005F00310039005B0030005D>': data.property1Management,
-            '<FEFF00660031005F00320030005B0030005D>': data.property1MortgageInterest,
-            '<FEFF00660031005F00320031005B0030005D>': data.property1OtherInterest,
-            '<FEFF00660031005F00320032005B0030005D>': data.property1Repairs,
-            '<FEFF00660031005F00320033005B0030005D>': data.property1Supplies,
-            '<FEFF00660031005F00320034005B0030005D>': data.property1Taxes,
-            '<FEFF00660031005F00320035005B0030005D>': data.property1Utilities,
-            '<FEFF00660031005F00320036005B0030005D>': data.property1Depreciation,
-            
-            # Property 2 fields (f2_ prefix)
-            '<FEFF00660032005F0031005B0030005D>': data.property2Type,
-            '<FEFF00660032005F0032005B0030005D>': data.property2Address,
-            '<FEFF00660032005F0033005B0030005D>': data.property2City,
-            '<FEFF00660032005F0034005B0030005D>': data.property2State,
-            '<FEFF00660032005F0035005B0030005D>': data.property2ZipCode,
-            '<FEFF00660032005F0036005B0030005D>': data.property2RentalDays,
-            '<FEFF00660032005F0037005B0030005D>': data.property2PersonalDays,
-            '<FEFF00660032005F0038005B0030005D>': data.property2RentalIncome,
-            '<FEFF00660032005F0039005B0030005D>': data.property2Royalties,
-            '<FEFF00660032005F00310030005B0030005D>': data.property2OtherIncome,
-            '<FEFF00660032005F00310031005B0030005D>': data.property2Advertising,
-            '<FEFF00660032005F00310032005B0030005D>': data.property2AutoTravel,
-            '<FEFF00660032005F00310033005B0030005D>': data.property2Cleaning,
-            '<FEFF00660032005F00310034005B0030005D>': data.property2Commissions,
-            '<FEFF00660032005F00310035005B0030005D>': data.property2Insurance,
-            '<FEFF00660032005F00310036005B0030005D>': data.property2Legal,
-            '<FEFF00660032005F00310037005B0030005D>': data.property2Management,
-            '<FEFF00660032005F00310038005B0030005D>': data.property2MortgageInterest,
-            '<FEFF00660032005F00310039005B0030005D>': data.property2OtherInterest,
-            '<FEFF00660032005F00320030005B0030005D>': data.property2Repairs,
-            '<FEFF00660032005F00320031005B0030005D>': data.property2Supplies,
-            '<FEFF00660032005F00320032005B0030005D>': data.property2Taxes,
-            '<FEFF00660032005F00320033005B0030005D>': data.property2Utilities,
-            '<FEFF00660032005F00320034005B0030005D>': data.property2Depreciation,
-        }
-        
-        filled_fields = 0
-        for page in template.pages:
-            if '/Annots' in page:
-                for annot in page['/Annots']:
-                    if annot['/Subtype'] == '/Widget':
-                        field_name = annot['/T']
-                        if field_name in field_mappings:
-                            value = field_mappings[field_name]
-                            if value:
-                                annot.update(PdfDict(V=str(value)))
-                                filled_fields += 1
-        
-        output.addpage(template.pages[0])
-        if len(template.pages) > 1:
-            output.addpage(template.pages[1])
-        
-        output.write(output_path)
+        if template is None:
+            template = PdfReader(template_path)
+        
+        filled_fields = fill_template_fields(template, schedule_e_field_mappings(data))
+        write_filled_template(template, output_path)
         logger.info(f"Filled {filled_fields} fields in Schedule E PDF")
         return True
         
@@ -704,6 +762,156 @@ def fill_schedule_e_pdf_template(template_path: str, output_path: str, data: Sch
         logger.error(f"Error filling Schedule E PDF template: {e}")
         return create_schedule_e_fallback_pdf(data, output_path)
 
+MASK_VISIBLE_CHARACTERS = {"ssn": 4}
+
+def mask_value(value: str, visible: int = 0) -> str:
+    # Values too short to keep a visible tail (a state code, a partial SSN)
+    # are masked entirely.
+    positions = [i for i, ch in enumerate(value) if ch.isalnum()]
+    hidden = set(positions[:-visible] if 0 < visible < len(positions) else positions)
+    return "".join("X" if i in hidden else ch for i, ch in enumerate(value))
+
+def apply_variant_transforms(data: BaseModel, variant: OutputVariant) -> BaseModel:
+    updates = {
+        name: mask_value(getattr(data, name), MASK_VISIBLE_CHARACTERS.get(name, 0))
+        for name in variant.mask
+    }
+    updates.update({name: "" for name in variant.omit})
+    return data.model_copy(update=updates)
+
+def index_template_widgets(template) -> Dict[str, list]:
+    widgets = {}
+    for page in template.pages:
+        if '/Annots' in page:
+            for annot in page['/Annots']:
+                if annot['/Subtype'] == '/Widget' and annot['/T'] is not None:
+                    widgets.setdefault(annot['/T'], []).append(annot)
+    return widgets
+
+def set_widget_values(widgets: Dict[str, list], field_mappings: Dict[str, str]) -> None:
+    for field_name, value in field_mappings.items():
+        for annot in widgets.get(field_name, []):
+            if value:
+                annot.update(PdfDict(V=str(value)))
+            elif annot['/V'] is not None:
+                annot.V = None
+
+def create_watermark_overlay(text: str):
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    c.setFont("Helvetica-Bold", 60)
+    c.setFillGray(0.5, 0.3)
+    c.translate(width / 2, height / 2)
+    c.rotate(45)
+    c.drawCentredString(0, 0, text)
+    c.save()
+    return PdfReader(fdata=buffer.getvalue()).pages[0]
+
+def watermarked_page(page, overlay):
+    # Merge onto a shallow copy so the shared template page stays untouched
+    # for the remaining variants.
+    page_copy = PdfDict(page)
+    page_copy.indirect = True
+    resources = PdfDict(page.inheritable.Resources or PdfDict())
+    if resources.XObject is not None:
+        resources.XObject = PdfDict(resources.XObject)
+    page_copy.Resources = resources
+    PageMerge(page_copy).add(overlay).render()
+    return page_copy
+
+def render_fallback_variants(fallback_func: Callable, data: BaseModel, variants: List[OutputVariant]) -> Dict[str, bytes]:
+    # The reportlab summary has no template pages to stamp, so a requested
+    # watermark must fail rather than yield an unmarked copy.
+    watermarked = [variant.name for variant in variants if variant.watermark]
+    if watermarked:
+        raise RuntimeError(f"Cannot watermark variants {watermarked} without the PDF template")
+
+    outputs = {}
+    for variant in variants:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+            output_path = tmp_file.name
+        try:
+            if not fallback_func(apply_variant_transforms(data, variant), output_path):
+                raise RuntimeError(f"Failed to render variant {variant.name}")
+            with open(output_path, "rb") as f:
+                outputs[variant.name] = f.read()
+        finally:
+            os.unlink(output_path)
+    return outputs
+
+def render_variants(template_path: Path, data: BaseModel, variants: List[OutputVariant],
+                    field_mappings_func: Callable, fallback_func: Callable) -> Dict[str, bytes]:
+    if not PDF_LIBRARY_AVAILABLE:
+        return render_fallback_variants(fallback_func, data, variants)
+
+    try:
+        # Parse and fill once; each variant only rewrites the widgets whose
+        # values differ from the base fill and restores them afterwards.
+        template = PdfReader(str(template_path))
+        base_mappings = field_mappings_func(data)
+        fill_template_fields(template, base_mappings)
+        widgets = index_template_widgets(template)
+        overlays = {}
+
+        outputs = {}
+        for variant in variants:
+            variant_mappings = field_mappings_func(apply_variant_transforms(data, variant))
+            changed = {k: v for k, v in variant_mappings.items() if v != base_mappings.get(k)}
+            set_widget_values(widgets, changed)
+
+            pages = template.pages[:2]
+            if variant.watermark:
+                if variant.watermark not in overlays:
+                    overlays[variant.watermark] = create_watermark_overlay(variant.watermark)
+                pages = [watermarked_page(page, overlays[variant.watermark]) for page in pages]
+
+            output = PdfWriter()
+            for page in pages:
+                output.addpage(page)
+            buffer = io.BytesIO()
+            output.write(buffer)
+            outputs[variant.name] = buffer.getvalue()
+
+            set_widget_values(widgets, {k: base_mappings.get(k) for k in changed})
+
+        logger.info(f"Rendered {len(outputs)} variants from one template fill")
+        return outputs
+
+    except Exception as e:
+        logger.error(f"Error rendering PDF variants: {e}")
+        return render_fallback_variants(fallback_func, data, variants)
+
+def decode_field_name(field_name: str) -> str:
+    # Template field names are UTF-16BE hex strings, e.g. '<FEFF0066...>' -> 'f1_1[0]'
+    if field_name.startswith('<FEFF') and field_name.endswith('>'):
+        try:
+            return bytes.fromhex(field_name[5:-1]).decode('utf-16-be')
+        except ValueError:
+            pass
+    return field_name
+
+def build_field_sources(model: type, field_mappings_func: Callable) -> Dict[str, List[str]]:
+    # Fill the mappings with one sentinel per input to find which template
+    # fields each input lands in, without duplicating the mapping tables.
+    sentinels = {
+        name: f"\x00{name}\x00"
+        for name, field in model.model_fields.items()
+        if field.annotation is str
+    }
+    probe = model.model_construct(**sentinels)
+    sources = {name: [] for name in model.model_fields}
+    for field_name, value in field_mappings_func(probe).items():
+        for name, sentinel in sentinels.items():
+            if sentinel in str(value):
+                sources[name].append(decode_field_name(field_name))
+    return sources
+
+PREVIEW_FORMS = {
+    FormType.SCHEDULE_C: (ScheduleCData, calculate_schedule_c_totals, build_field_sources(ScheduleCData, schedule_c_field_mappings)),
+    FormType.SCHEDULE_E: (ScheduleEData, calculate_schedule_e_totals, build_field_sources(ScheduleEData, schedule_e_field_mappings)),
+}
+
 @app.get("/")
 async def root():
     return {"message": "Tax Form Generator API", "status": "running"}
@@ -717,9 +925,122 @@ async def health_check():
         "pdf_library": PDF_LIBRARY_AVAILABLE,
         "reportlab": REPORTLAB_AVAILABLE,
         "schedule_c_template_exists": schedule_c_template.exists(),
-        "schedule_e_template_exists": schedule_e_template.exists()
+        "schedule_e_template_exists": schedule_e_template.exists(),
+        "artifact_store": artifact_store is not None
     }
 
+# Identical render requests arriving while one is in flight share its result.
+# RENDER_CONCURRENCY caps renders running in the threadpool at once and
+# MAX_IN_FLIGHT_RENDERS caps distinct renders queued or running.
+render_semaphore = asyncio.Semaphore(int(os.environ.get("RENDER_CONCURRENCY", 4)))
+max_in_flight_renders = int(os.environ.get("MAX_IN_FLIGHT_RENDERS", 64))
+in_flight_renders: Dict[str, asyncio.Future] = {}
+template_versions: Dict[Tuple[str, int, int], str] = {}
+
+def template_version(template_path: Path) -> str:
+    stat = template_path.stat()
+    key = (str(template_path), stat.st_mtime_ns, stat.st_size)
+    if key not in template_versions:
+        template_versions[key] = hashlib.sha256(template_path.read_bytes()).hexdigest()
+    return template_versions[key]
+
+def render_key(form_type: FormType, template_path: Path, data: BaseModel) -> str:
+    digest = hashlib.sha256()
+    digest.update(form_type.value.encode())
+    digest.update(template_version(template_path).encode())
+    digest.update(data.model_dump_json().encode())
+    return digest.hexdigest()
+
+def render_pdf_bytes(fill_func: Callable, template_path: Path, data: BaseModel) -> Optional[bytes]:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+        output_path = tmp_file.name
+    try:
+        if not fill_func(str(template_path), output_path, data):
+            return None
+        with open(output_path, "rb") as f:
+            return f.read()
+    finally:
+        os.unlink(output_path)
+
+async def run_render(fill_func: Callable, template_path: Path, data: BaseModel) -> Optional[bytes]:
+    async with render_semaphore:
+        return await run_in_threadpool(call_profiled, render_pdf_bytes, fill_func, template_path, data)
+
+async def render_coalesced(form_type: FormType, fill_func: Callable, template_path: Path, data: BaseModel) -> Optional[bytes]:
+    # A profiled request needs its own render to measure.
+    if current_profile.get() is not None:
+        return await run_render(fill_func, template_path, data)
+
+    key = render_key(form_type, template_path, data)
+    render = in_flight_renders.get(key)
+    if render is None:
+        if len(in_flight_renders) >= max_in_flight_renders:
+            raise HTTPException(status_code=503, detail="Too many renders in progress")
+        render = asyncio.ensure_future(run_render(fill_func, template_path, data))
+        in_flight_renders[key] = render
+        render.add_done_callback(lambda _: in_flight_renders.pop(key, None))
+    else:
+        logger.info(f"Coalesced {form_type.value} render request")
+
+    # Shielded so a disconnecting client does not cancel the render for the
+    # other requests waiting on it.
+    return await asyncio.shield(render)
+
+async def pdf_response(content: bytes, filename: str) -> Response:
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if artifact_store is not None:
+        try:
+            headers["X-Document-Id"] = await run_in_threadpool(artifact_store.put, content)
+        except Exception as e:
+            logger.error(f"Error storing generated PDF: {e}")
+    return Response(content, media_type="application/pdf", headers=headers)
+
+def parse_range_header(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end:
+        return None
+    return start, end
+
+@app.get("/documents/{document_id}")
+async def get_document(document_id: str, request: Request):
+    if artifact_store is None:
+        raise HTTPException(status_code=404, detail="Artifact store is not enabled")
+
+    content = await run_in_threadpool(artifact_store.get, document_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    size = len(content)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{document_id}.pdf"',
+    }
+
+    range_header = request.headers.get("range")
+    if not range_header:
+        return Response(content, media_type="application/pdf", headers=headers)
+
+    byte_range = parse_range_header(range_header, size)
+    if byte_range is None:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content[start:end + 1], status_code=206, media_type="application/pdf", headers=headers)
+
 @app.post("/generate-schedule-c")
 async def generate_schedule_c_pdf(data: ScheduleCData):
     try:
@@ -727,21 +1048,15 @@ async def generate_schedule_c_pdf(data: ScheduleCData):
         if not template_path.exists():
             raise HTTPException(status_code=404, detail="Schedule C PDF template not found")
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            output_path = tmp_file.name
+        content = await render_coalesced(FormType.SCHEDULE_C, fill_schedule_c_pdf_template, template_path, data)
         
-        success = fill_schedule_c_pdf_template(str(template_path), output_path, data)
-        
-        if not success:
+        if content is None:
             raise HTTPException(status_code=500, detail="Failed to generate Schedule C PDF")
         
-        return FileResponse(
-            output_path,
-            media_type="application/pdf",
-            filename="schedule_c_report.pdf",
-            background=None
-        )
+        return await pdf_response(content, "schedule_c_report.pdf")
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating Schedule C PDF: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -753,25 +1068,136 @@ async def generate_schedule_e_pdf(data: ScheduleEData):
         if not template_path.exists():
             raise HTTPException(status_code=404, detail="Schedule E PDF template not found")
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            output_path = tmp_file.name
-        
-        success = fill_schedule_e_pdf_template(str(template_path), output_path, data)
+        content = await render_coalesced(FormType.SCHEDULE_E, fill_schedule_e_pdf_template, template_path, data)
         
-        if not success:
+        if content is None:
             raise HTTPException(status_code=500, detail="Failed to generate Schedule E PDF")
         
-        return FileResponse(
-            output_path,
-            media_type="application/pdf",
-            filename="schedule_e_report.pdf",
-            background=None
-        )
+        return await pdf_response(content, "schedule_e_report.pdf")
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating Schedule E PDF: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/preview/{form_type}")
+async def preview_form(form_type: FormType, payload: Dict[str, Any]):
+    model, calculate_totals_func, field_sources = PREVIEW_FORMS[form_type]
+    try:
+        data = model.model_validate(payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+    values = data.model_dump()
+    fields = {}
+    unmapped = []
+    for name, value in values.items():
+        if value in ("", False):
+            continue
+        if field_sources[name]:
+            fields[name] = field_sources[name]
+        else:
+            unmapped.append(name)
+
+    return {
+        "form_type": form_type.value,
+        "values": values,
+        "totals": calculate_totals_func(data),
+        "fields": fields,
+        "unmapped": unmapped,
+    }
+
+def require_profiling_token(request: Request) -> None:
+    if not profiler.authorized(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+class ProfilingSettings(BaseModel):
+    sample_rate: float
+
+@app.get("/debug/profiling")
+async def get_profiling(request: Request):
+    require_profiling_token(request)
+    return {"sample_rate": profiler.sample_rate, "profiles": profiler.list_profiles()}
+
+@app.post("/debug/profiling")
+async def set_profiling(settings: ProfilingSettings, request: Request):
+    require_profiling_token(request)
+    if not 0.0 <= settings.sample_rate <= 1.0:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+    profiler.sample_rate = settings.sample_rate
+    logger.info(f"Render profiling sample rate set to {settings.sample_rate}")
+    return {"sample_rate": profiler.sample_rate}
+
+@app.post("/debug/tracemalloc/snapshot")
+async def tracemalloc_snapshot(request: Request, limit: int = 25):
+    require_profiling_token(request)
+    return profiler.tracemalloc_snapshot(limit)
+
+@app.delete("/debug/tracemalloc")
+async def tracemalloc_stop(request: Request):
+    require_profiling_token(request)
+    profiler.tracemalloc_stop()
+    return {"tracing": False}
+
+async def generate_variants_zip(form_type: FormType, template_name: str, data: BaseModel,
+                                variants: List[OutputVariant], field_mappings_func: Callable,
+                                fallback_func: Callable) -> Response:
+    try:
+        template_path = Path(__file__).parent / template_name
+        if not template_path.exists():
+            raise HTTPException(status_code=404, detail="PDF template not found")
+
+        if not variants:
+            raise HTTPException(status_code=422, detail="At least one variant is required")
+        names = [variant.name for variant in variants]
+        if len(set(names)) != len(names):
+            raise HTTPException(status_code=422, detail="Variant names must be unique")
+        text_fields = {name for name, field in type(data).model_fields.items() if field.annotation is str}
+        for variant in variants:
+            unknown = sorted(set(variant.mask + variant.omit) - text_fields)
+            if unknown:
+                raise HTTPException(status_code=422, detail=f"Unknown fields in variant {variant.name}: {unknown}")
+
+        if any(variant.watermark for variant in variants) and not (PDF_LIBRARY_AVAILABLE and REPORTLAB_AVAILABLE):
+            raise HTTPException(status_code=503, detail="Watermarking requires pdfrw and reportlab")
+
+        async with render_semaphore:
+            outputs = await run_in_threadpool(
+                call_profiled, render_variants, template_path, data, variants, field_mappings_func, fallback_func
+            )
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, content in outputs.items():
+                archive.writestr(f"{form_type.value}_{name}.pdf", content)
+
+        return Response(
+            buffer.getvalue(),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{form_type.value}_variants.zip"'}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating {form_type.value} variants: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate-schedule-c/variants")
+async def generate_schedule_c_variants(request: ScheduleCVariantsRequest):
+    return await generate_variants_zip(
+        FormType.SCHEDULE_C, "f1040sc.pdf", request.data, request.variants,
+        schedule_c_field_mappings, create_schedule_c_fallback_pdf
+    )
+
+@app.post("/generate-schedule-e/variants")
+async def generate_schedule_e_variants(request: ScheduleEVariantsRequest):
+    return await generate_variants_zip(
+        FormType.SCHEDULE_E, "schedule-e.pdf", request.data, request.variants,
+        schedule_e_field_mappings, create_schedule_e_fallback_pdf
+    )
+
 # Keep the old endpoint for backward compatibility
 @app.post("/generate-pdf")
 async def generate_pdf(data: ScheduleCData):
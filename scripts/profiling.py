@@ -0,0 +1,127 @@
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Renders run in the threadpool, so the profile for the current request is
+# carried in a context variable and enabled inside the render thread itself.
+current_profile: ContextVar[Optional[cProfile.Profile]] = ContextVar("current_profile", default=None)
+
+def call_profiled(func: Callable, *args, **kwargs):
+    profile = current_profile.get()
+    if profile is None:
+        return func(*args, **kwargs)
+
+    try:
+        profile.enable()
+    except ValueError as e:
+        logger.warning(f"Could not start profiler: {e}")
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.disable()
+
+class RenderProfiler:
+    # Everything here is disabled unless PROFILING_TOKEN is set, and every
+    # request that asks for profiling data must present that token.
+    def __init__(self, token: Optional[str], max_profiles: int = 50, stats_limit: int = 40):
+        self.token = token
+        self.sample_rate = 0.0
+        self.stats_limit = stats_limit
+        self.profiles = deque(maxlen=max_profiles)
+        self.last_snapshot = None
+        # cProfile can only be active once per interpreter, so concurrent
+        # requests skip sampling instead of failing.
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    def authorized(self, presented: Optional[str]) -> bool:
+        return self.enabled and presented is not None and hmac.compare_digest(presented, self.token)
+
+    def should_sample(self) -> bool:
+        return self.enabled and self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if not self._lock.acquire(blocking=False):
+            return None
+        return cProfile.Profile()
+
+    def stop(self, profile: cProfile.Profile, path: str, elapsed: float) -> Dict:
+        self._lock.release()
+
+        stream = io.StringIO()
+        try:
+            stats = pstats.Stats(profile, stream=stream)
+            stats.sort_stats("cumulative").print_stats(self.stats_limit)
+        except TypeError:
+            # Nothing was collected, e.g. the request failed before rendering.
+            stream.write("No render was profiled for this request\n")
+        return {
+            "path": path,
+            "timestamp": time.time(),
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "stats": stream.getvalue(),
+        }
+
+    def record(self, result: Dict) -> None:
+        self.profiles.append(result)
+
+    def list_profiles(self) -> List[Dict]:
+        return list(self.profiles)
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def tracemalloc_snapshot(self, limit: int = 25) -> Dict:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(int(os.environ.get("PROFILING_TRACEMALLOC_FRAMES", 10)))
+            self.last_snapshot = self._take_snapshot()
+            return {"tracing": True, "started": True, "top": [], "diff": []}
+
+        snapshot = self._take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        top = [str(stat) for stat in snapshot.statistics("lineno")[:limit]]
+        diff = []
+        if self.last_snapshot is not None:
+            diff = [str(stat) for stat in snapshot.compare_to(self.last_snapshot, "lineno")[:limit]]
+        self.last_snapshot = snapshot
+        return {
+            "tracing": True,
+            "started": False,
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top": top,
+            "diff": diff,
+        }
+
+    def tracemalloc_stop(self) -> None:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.last_snapshot = None
+
+def create_profiler_from_env() -> RenderProfiler:
+    profiler = RenderProfiler(
+        os.environ.get("PROFILING_TOKEN") or None,
+        max_profiles=int(os.environ.get("PROFILING_MAX_PROFILES", 50)),
+    )
+    if profiler.enabled:
+        logger.info("Render profiling endpoints enabled")
+    return profiler